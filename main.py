@@ -1,17 +1,22 @@
 import os
+import gzip
+import html
+import queue
+import asyncio
+import hashlib
 import logging
+import concurrent.futures
+from collections import OrderedDict
 from aiogram import Bot, Dispatcher, types, Router, F
 from aiogram.filters import Command
 from aiogram.types import WebAppInfo
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-import qrcode
 from io import BytesIO
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 import uvicorn
 from contextlib import asynccontextmanager
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.gzip import GZipMiddleware
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -46,10 +51,7 @@ logger.info(f"Bot configured with BASE_URL: {BASE_URL}")
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
 router = Router()
-app = FastAPI(title="QR Master Bot")
-
-# Добавляем сжатие GZIP
-app.add_middleware(GZipMiddleware, minimum_size=500)
+app = FastAPI(title="QR Master Bot", default_response_class=ORJSONResponse)
 
 # Подключаем роутер
 dp.include_router(router)
@@ -87,11 +89,21 @@ class BotStyles:
 ⚠️ <i>Пожалуйста, попробуйте еще раз или обратитесь в поддержку.</i>
     """
 
+    QUICK_GENERATE_HELP = (
+        "🚀 <b>Быстрая генерация QR-кода</b>\n\n"
+        "📝 <i>Отправьте мне текст или ссылку, и я создам QR-код!</i>\n\n"
+        "💡 <b>Примеры:</b>\n"
+        "• https://example.com\n"
+        "• Ваш текст здесь\n"
+        "• +79991234567\n"
+        "• YOUR_WIFI_NAME;WPA;PASSWORD"
+    )
+
 # Главное меню с инлайн-кнопками
-def get_main_keyboard():
+def _build_main_keyboard():
     builder = InlineKeyboardBuilder()
     builder.button(
-        text="📷 Сканировать QR-код", 
+        text="📷 Сканировать QR-код",
         web_app=WebAppInfo(url=f"{BASE_URL}/scanner")
     )
     builder.button(
@@ -105,23 +117,125 @@ def get_main_keyboard():
     builder.adjust(2, 1)
     return builder.as_markup()
 
+# BASE_URL фиксирован на старте процесса, поэтому клавиатуру строим один раз
+MAIN_KEYBOARD = _build_main_keyboard()
+
+def get_main_keyboard():
+    return MAIN_KEYBOARD
+
+# Пул переиспользуемых экземпляров qrcode.QRCode: не пересоздаём
+# матрицу модулей и таблицы Рида-Соломона на каждый вызов
+_QR_CODERS = queue.LifoQueue()
+
 # Генерация QR-кода
-def generate_qr_code(data: str) -> BytesIO:
-    """Генерирует QR-код и возвращает BytesIO объект"""
-    qr = qrcode.QRCode(
-        version=7,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
+def _render_qr_png(data: str) -> bytes:
+    """Рендерит QR-код и возвращает PNG как bytes
+
+    Графический стек импортируется лениво: /health и /webhook
+    не платят за загрузку qrencode/qrcode/PIL/NumPy на холодном старте.
+    """
+    from PIL import Image, ImageOps
+    try:
+        import qrencode  # C-биндинг libqrencode, на порядки быстрее чистого Python
+    except ImportError:
+        qrencode = None
+
+    if qrencode is not None:
+        # Быстрый путь: кодирование, маскирование и Рид-Соломон в C
+        _version, size, img = qrencode.encode(
+            data,
+            level=qrencode.QR_ECLEVEL_L,
+            hint=qrencode.QR_MODE_8,
+            case_sensitive=True,
+        )
+        # libqrencode не рисует тихую зону — добавляем рамку в 4 модуля
+        img = ImageOps.expand(img, border=4, fill=255)
+        size += 8
+        # 10 пикселей на модуль, как box_size=10 у qrcode
+        img = img.resize((size * 10, size * 10), Image.NEAREST)
+    else:
+        # Запасной путь на чистом Python, если qrencode не установлен
+        import qrcode
+        import numpy as np
+        from utils.qr_generator import QRGenerator
+
+        try:
+            qr = _QR_CODERS.get_nowait()
+        except queue.Empty:
+            qr = qrcode.QRCode(
+                version=7,
+                error_correction=qrcode.constants.ERROR_CORRECT_L,
+                box_size=10,
+                border=4,
+            )
+            # Фиксированная маска вместо полного перебора best_mask_pattern
+            qr.best_mask_pattern = lambda: 0
+        try:
+            qr.clear()
+            qr.version = 7  # fit мог увеличить версию в прошлый раз
+            qr.add_data(data)
+            # Подбор версии не нужен, если данные заведомо умещаются в v7
+            qr.make(fit=not QRGenerator.validate_data(data))
+            # Рендерим матрицу модулей напрямую в пиксельный буфер NumPy:
+            # без make_image и десятков тысяч вызовов ImageDraw.rectangle
+            mods = np.asarray(qr.modules, dtype=np.uint8)
+        finally:
+            _QR_CODERS.put(qr)
+        pix = np.where(mods, 0, 255).astype(np.uint8)
+        pix = np.repeat(np.repeat(pix, 10, 0), 10, 1)  # box_size=10
+        pix = np.pad(pix, 4 * 10, constant_values=255)  # border=4
+        img = Image.fromarray(pix, mode="L")
+
+    # Режим "1" PNG хранит как 1 бит на пиксель нативно, а минимальное
+    # сжатие пропускает почти всю работу zlib; размер почти не растёт
+    img = img.convert("1")
     img_io = BytesIO()
-    img.save(img_io, 'PNG')
-    img_io.seek(0)
-    return img_io
+    img.save(img_io, format="PNG", optimize=False, compress_level=1)
+    return img_io.getvalue()
+
+# Генерация детерминирована по data, поэтому готовый PNG кэшируем.
+# Кэш явный (не functools.lru_cache): хендлеру нужно проверять попадание
+# до отправки задачи в пул процессов, а /health — честная статистика
+_QR_CACHE: OrderedDict = OrderedDict()
+_QR_CACHE_MAXSIZE = 512
+_QR_CACHE_STATS = {"hits": 0, "misses": 0}
+
+def _qr_cache_get(data: str):
+    png = _QR_CACHE.get(data)
+    if png is None:
+        _QR_CACHE_STATS["misses"] += 1
+        return None
+    _QR_CACHE.move_to_end(data)
+    _QR_CACHE_STATS["hits"] += 1
+    return png
+
+def _qr_cache_put(data: str, png: bytes):
+    _QR_CACHE[data] = png
+    if len(_QR_CACHE) > _QR_CACHE_MAXSIZE:
+        _QR_CACHE.popitem(last=False)
+
+def generate_qr_code(data: str) -> bytes:
+    """Генерирует QR-код и возвращает PNG как bytes
+
+    Повторные запросы одного и того же текста (типично для ссылок)
+    отдаются из LRU-кэша без перекодирования. Длинные данные (>512
+    символов) не кэшируются, чтобы ограничить расход памяти.
+
+    В запасном пути на чистом Python перебор масок отключён (маска 0):
+    это ~2/3 времени генерации, а читаемость кода страдает лишь на
+    патологических входах.
+    """
+    if len(data) > 512:
+        return _render_qr_png(data)
+    png = _qr_cache_get(data)
+    if png is None:
+        png = _render_qr_png(data)
+        _qr_cache_put(data, png)
+    return png
+
+# Пул процессов для CPU-тяжёлой генерации: не блокируем event loop
+# (и обходим GIL на циклах qrcode/PIL)
+QR_POOL = concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count())
 
 # Команда /start
 @router.message(Command("start"))
@@ -136,13 +250,7 @@ async def start_command(message: types.Message):
 @router.callback_query(F.data == "quick_generate")
 async def quick_generate_handler(callback: types.CallbackQuery):
     await callback.message.answer(
-        "🚀 <b>Быстрая генерация QR-кода</b>\n\n"
-        "📝 <i>Отправьте мне текст или ссылку, и я создам QR-код!</i>\n\n"
-        "💡 <b>Примеры:</b>\n"
-        "• https://example.com\n"
-        "• Ваш текст здесь\n"
-        "• +79991234567\n"
-        "• YOUR_WIFI_NAME;WPA;PASSWORD",
+        BotStyles.QUICK_GENERATE_HELP,
         parse_mode="HTML"
     )
     await callback.answer()
@@ -157,15 +265,24 @@ async def generate_qr_from_text(message: types.Message):
         return
     
     try:
-        await message.answer("⏳ <i>Создаю QR-код...</i>", parse_mode="HTML")
-        
-        # Генерируем QR-код
-        qr_image = generate_qr_code(text)
-        
+        # Индикатор "отправляет фото" вместо отдельного сообщения-заглушки:
+        # экономим полный round-trip к Telegram API на каждый запрос
+        await bot.send_chat_action(message.chat.id, "upload_photo")
+
+        # Попадания в кэш отдаём прямо из этого процесса; только промахи
+        # уходят в пул, чтобы не блокировать event loop рендером
+        qr_bytes = _qr_cache_get(text) if len(text) <= 512 else None
+        if qr_bytes is None:
+            qr_bytes = await asyncio.get_running_loop().run_in_executor(
+                QR_POOL, _render_qr_png, text
+            )
+            if len(text) <= 512:
+                _qr_cache_put(text, qr_bytes)
+
         # Отправляем изображение
         await message.answer_photo(
             types.BufferedInputFile(
-                qr_image.getvalue(),
+                qr_bytes,
                 filename="qrcode.png"
             ),
             caption=BotStyles.QR_GENERATED,
@@ -176,15 +293,19 @@ async def generate_qr_from_text(message: types.Message):
         logger.error(f"Error generating QR: {e}")
         await message.answer(BotStyles.ERROR_TEXT, parse_mode="HTML")
 
+# Шаблон ответа WebApp постоянен — собираем его конкатенацией половинок
+# вместо f-строки на каждый вызов
+_WEBAPP_PREFIX = "✅ <b>Результат сканирования:</b>\n\n<code>"
+_WEBAPP_SUFFIX = "</code>\n\n💡 <i>Отправьте этот текст мне, чтобы создать QR-код!</i>"
+
 # Обработка данных из WebApp
 @router.message(F.web_app_data)
 async def handle_web_app_data(message: types.Message):
     try:
         qr_data = message.web_app_data.data
+        # html.escape: сырые < и & из QR-кода ломали HTML-разметку ответа
         await message.answer(
-            f"✅ <b>Результат сканирования:</b>\n\n"
-            f"<code>{qr_data}</code>\n\n"
-            f"💡 <i>Отправьте этот текст мне, чтобы создать QR-код!</i>",
+            _WEBAPP_PREFIX + html.escape(qr_data) + _WEBAPP_SUFFIX,
             parse_mode="HTML"
         )
     except Exception as e:
@@ -195,59 +316,99 @@ async def handle_web_app_data(message: types.Message):
 os.makedirs("static", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Middleware для кэширования
-@app.middleware("http")
-async def add_cache_headers(request: Request, call_next):
-    response = await call_next(request)
-    if request.url.path.endswith(('.html', '.css', '.js')):
-        response.headers["Cache-Control"] = "public, max-age=3600"
-    return response
+# Статика фиксирована, поэтому читаем и сжимаем её один раз на старте:
+# ни одного syscall и ни одного пережатия на запрос
+_PAGE_CACHE: dict = {}  # имя файла -> (байты, gzip-байты, ETag)
+for _name in os.listdir("static"):
+    if _name.endswith(('.html', '.css', '.js')):
+        with open(os.path.join("static", _name), "rb") as _f:
+            _raw = _f.read()
+        _PAGE_CACHE[_name] = (
+            _raw,
+            gzip.compress(_raw, compresslevel=9),
+            f'"{hashlib.md5(_raw).hexdigest()}"',
+        )
+
+def _serve_static_page(request: Request, name: str) -> Response:
+    """Отдаёт страницу из кэша в памяти с поддержкой gzip и ETag/304"""
+    cached = _PAGE_CACHE.get(name)
+    if cached is None:
+        return FileResponse(
+            f"static/{name}",
+            headers={"Cache-Control": "public, max-age=3600"},
+        )
+    raw, gzipped, etag = cached
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    headers = {
+        "Cache-Control": "public, max-age=3600",
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+    }
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=gzipped, media_type="text/html", headers=headers)
+    return Response(content=raw, media_type="text/html", headers=headers)
 
 @app.get("/")
 async def root():
     return {"status": "QR Bot is running!", "webhook_url": f"{BASE_URL}/webhook"}
 
 @app.get("/scanner")
-async def scanner_page():
-    return FileResponse("static/scanner.html")
+async def scanner_page(request: Request):
+    return _serve_static_page(request, "scanner.html")
 
 @app.get("/generator")
-async def generator_page():
-    return FileResponse("static/generator.html")
+async def generator_page(request: Request):
+    return _serve_static_page(request, "generator.html")
 
 # Эндпоинт для проверки здоровья (для cron-job.org)
 @app.get("/health")
 async def health_check():
     return {
-        "status": "healthy", 
+        "status": "healthy",
         "service": "QR Telegram Bot",
-        "webhook_set": bool(BOT_TOKEN and BASE_URL)
+        "webhook_set": bool(BOT_TOKEN and BASE_URL),
+        "qr_cache": {
+            **_QR_CACHE_STATS,
+            "currsize": len(_QR_CACHE),
+            "maxsize": _QR_CACHE_MAXSIZE,
+        }
     }
 
+async def _register_webhook():
+    """Регистрирует вебхук в Telegram, предварительно удалив старый"""
+    webhook_url = f"{BASE_URL}/webhook"
+    logger.info(f"Setting webhook to: {webhook_url}")
+
+    # Сначала удаляем старый вебхук
+    await bot.delete_webhook(drop_pending_updates=True)
+
+    # Устанавливаем новый вебхук
+    await bot.set_webhook(webhook_url)
+    logger.info("Webhook set successfully!")
+
 # Lifespan для управления вебхуком
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     try:
-        # Устанавливаем вебхук только если все переменные настроены
-        if BOT_TOKEN and BASE_URL:
-            webhook_url = f"{BASE_URL}/webhook"
-            logger.info(f"Setting webhook to: {webhook_url}")
-            
-            # Сначала удаляем старый вебхук
-            await bot.delete_webhook(drop_pending_updates=True)
-            
-            # Устанавливаем новый вебхук
-            await bot.set_webhook(webhook_url)
-            logger.info("Webhook set successfully!")
-        else:
+        # Устанавливаем вебхук только если все переменные настроены.
+        # WEBHOOK_MASTER=0 означает, что вебхук уже зарегистрирован
+        # родительским процессом до запуска воркеров (см. __main__).
+        if BOT_TOKEN and BASE_URL and os.getenv("WEBHOOK_MASTER", "1") == "1":
+            await _register_webhook()
+        elif not (BOT_TOKEN and BASE_URL):
             logger.error("Cannot set webhook: BOT_TOKEN or BASE_URL not configured")
-            
+
     except Exception as e:
         logger.error(f"Failed to set webhook: {e}")
-    
+
     yield
     
-    # При завершении работы
+    # При завершении работы: даём фоновым апдейтам доработать
+    if _PENDING_UPDATES:
+        await asyncio.gather(*_PENDING_UPDATES, return_exceptions=True)
+    QR_POOL.shutdown(wait=False, cancel_futures=True)
     try:
         await bot.session.close()
     except Exception as e:
@@ -255,18 +416,56 @@ async def lifespan(app: FastAPI):
 
 app.router.lifespan_context = lifespan
 
+# Обработка апдейтов в фоне: вебхук отвечает Telegram сразу,
+# не дожидаясь завершения хендлеров
+_UPDATE_SEMAPHORE = asyncio.Semaphore(64)  # ограничивает параллельные рендеры
+_PENDING_UPDATES: set = set()  # держим ссылки на задачи, чтобы их не собрал GC
+
+async def _dispatch_update(telegram_update: types.Update):
+    async with _UPDATE_SEMAPHORE:
+        await dp.feed_update(bot=bot, update=telegram_update)
+
 # Вебхук для Telegram
 @app.post("/webhook")
 async def webhook(request: Request):
     try:
-        update = await request.json()
-        telegram_update = types.Update(**update)
-        await dp.feed_update(bot=bot, update=telegram_update)
-        return {"status": "ok"}
+        # model_validate_json парсит сырые байты напрямую в pydantic-core,
+        # минуя промежуточный dict от request.json()
+        raw = await request.body()
+        telegram_update = types.Update.model_validate_json(raw)
+        task = asyncio.create_task(_dispatch_update(telegram_update))
+        _PENDING_UPDATES.add(task)
+        task.add_done_callback(_PENDING_UPDATES.discard)
+        return Response(content=b'{"status":"ok"}', media_type="application/json")
     except Exception as e:
         logger.error(f"Webhook error: {e}")
         return {"status": "error", "message": str(e)}
 
+async def _register_webhook_once():
+    try:
+        await _register_webhook()
+    except Exception as e:
+        logger.error(f"Failed to set webhook: {e}")
+    finally:
+        await bot.session.close()
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+
+    # Регистрируем вебхук один раз до запуска воркеров: lifespan
+    # выполняется в каждом из них, и повторные setWebhook с
+    # drop_pending_updates устроили бы гонку и потерю апдейтов
+    if BOT_TOKEN and BASE_URL and os.getenv("WEBHOOK_MASTER", "1") == "1":
+        asyncio.run(_register_webhook_once())
+        os.environ["WEBHOOK_MASTER"] = "0"  # воркеры вебхук не трогают
+
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", 2)),
+        access_log=False,
+        log_level="warning",
+    )
@@ -0,0 +1,106 @@
+"""JIT-компилируемые горячие участки библиотеки qrcode.
+
+lost_point (четыре штрафных правила стандарта QR) — самый тяжёлый цикл
+при переборе масок: чистый Python сканирует 2D-список целых чисел.
+Здесь те же правила реализованы как индексные циклы по непрерывному
+uint8-массиву NumPy и компилируются Numba в машинный код.
+"""
+
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def lost_point(modules):
+    """Считает штрафные очки матрицы модулей (uint8 0/1) по четырём правилам QR"""
+    n = modules.shape[0]
+    lost = 0
+
+    # Правило 1: горизонтальные и вертикальные серии одного цвета длиной >= 5
+    for row in range(n):
+        run = 1
+        for col in range(1, n):
+            if modules[row, col] == modules[row, col - 1]:
+                run += 1
+            else:
+                if run >= 5:
+                    lost += 3 + (run - 5)
+                run = 1
+        if run >= 5:
+            lost += 3 + (run - 5)
+
+    for col in range(n):
+        run = 1
+        for row in range(1, n):
+            if modules[row, col] == modules[row - 1, col]:
+                run += 1
+            else:
+                if run >= 5:
+                    lost += 3 + (run - 5)
+                run = 1
+        if run >= 5:
+            lost += 3 + (run - 5)
+
+    # Правило 2: блоки 2x2 одного цвета
+    for row in range(n - 1):
+        for col in range(n - 1):
+            if (modules[row, col] == modules[row, col + 1]
+                    and modules[row, col] == modules[row + 1, col]
+                    and modules[row, col] == modules[row + 1, col + 1]):
+                lost += 3
+
+    # Правило 3: шаблон 1011101, окружённый четырьмя светлыми модулями
+    for row in range(n):
+        for col in range(n - 6):
+            if (modules[row, col]
+                    and not modules[row, col + 1]
+                    and modules[row, col + 2]
+                    and modules[row, col + 3]
+                    and modules[row, col + 4]
+                    and not modules[row, col + 5]
+                    and modules[row, col + 6]):
+                if ((col >= 4
+                     and not modules[row, col - 1] and not modules[row, col - 2]
+                     and not modules[row, col - 3] and not modules[row, col - 4])
+                        or (col + 10 < n
+                            and not modules[row, col + 7] and not modules[row, col + 8]
+                            and not modules[row, col + 9] and not modules[row, col + 10])):
+                    lost += 40
+
+    for col in range(n):
+        for row in range(n - 6):
+            if (modules[row, col]
+                    and not modules[row + 1, col]
+                    and modules[row + 2, col]
+                    and modules[row + 3, col]
+                    and modules[row + 4, col]
+                    and not modules[row + 5, col]
+                    and modules[row + 6, col]):
+                if ((row >= 4
+                     and not modules[row - 1, col] and not modules[row - 2, col]
+                     and not modules[row - 3, col] and not modules[row - 4, col])
+                        or (row + 10 < n
+                            and not modules[row + 7, col] and not modules[row + 8, col]
+                            and not modules[row + 9, col] and not modules[row + 10, col])):
+                    lost += 40
+
+    # Правило 4: отклонение доли тёмных модулей от 50%
+    dark = 0
+    for row in range(n):
+        for col in range(n):
+            if modules[row, col]:
+                dark += 1
+    percent = dark * 100 // (n * n)
+    if percent >= 50:
+        ratio = percent - 50
+    else:
+        ratio = 50 - percent
+    lost += (ratio // 5) * 10
+
+    return lost
+
+
+def lost_point_from_modules(modules):
+    """Обёртка для qrcode.util.lost_point: принимает список списков bool/None"""
+    arr = np.asarray(modules, dtype=np.uint8)
+    return int(lost_point(arr))